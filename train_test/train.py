@@ -15,7 +15,6 @@ import open_clip
 from PIL import Image, ImageFile
 from tqdm import tqdm 
 from torch.utils.data import Dataset, DataLoader
-import torch_dct as dct
 from cross_attention_transformer import TransformerModel
 from torchvision.transforms.functional import InterpolationMode
 import io
@@ -123,39 +122,50 @@ class CustomDatasetWithCaptions(torch.utils.data.Dataset):
                 # Convert transformed image to grayscale
                 grayscale_tensor = transforms.functional.rgb_to_grayscale(image)
                 
-                # Scale to [-1, 1]
+                # Scale to [-1, 1]; the DCT itself is applied batched on GPU in Net.forward
                 grayscale_tensor = (grayscale_tensor * 2) - 1
-                
-                # Apply 2D DCT directly using dct_2d
-                DCT_transform = dct.dct_2d(grayscale_tensor, norm='ortho')
         except Exception as e:
             print(f"Error processing image: {img_path}\nException: {e}")
             raise
-            
+
         # Prepare caption
         caption = os.path.splitext(os.path.basename(img_path))[0]
         cleaned_caption = caption.replace('_', ' ')
-        
-        return image, DCT_transform, label, cleaned_caption
+
+        return image, grayscale_tensor, label, cleaned_caption
 
 def standard_scale(tensor):
     mean = tensor.mean()
     std = tensor.std()
     return (tensor - mean) / std
 
+def build_dct_basis(N):
+    """Build the NxN orthonormal DCT-II basis matrix (the 2D DCT is separable,
+    so it can be applied as two matmuls: C @ x @ C.T)."""
+    k = torch.arange(N, dtype=torch.float32).unsqueeze(1)
+    n = torch.arange(N, dtype=torch.float32).unsqueeze(0)
+    basis = torch.cos((2 * n + 1) * k * np.pi / (2 * N)) * np.sqrt(2 / N)
+    basis[0] *= 1 / np.sqrt(2)
+    return basis
+
 class Net(nn.Module):
     def __init__(self, CLIP_model, TransformerModel):
         super(Net, self).__init__()
         self.TransformerModel = TransformerModel(embed_dim=(768), num_heads=8)
         self.CLIP_model = CLIP_model
-        
+
         self.DCT_Embedder = nn.Linear((320*320), 768, bias=False)
         self.relu = torch.nn.ReLU()
+        # Precomputed DCT basis lives on the same device as the model, so the
+        # transform runs as one batched GPU matmul pair instead of per-sample on CPU
+        self.register_buffer('DCT_basis', build_dct_basis(320), persistent=False)
 
-    def forward(self, Images, Text_Encodings, DCT_features):
+    def forward(self, Images, Text_Encodings, Gray_Images):
         img_embedding = self.CLIP_model.encode_image(Images)
         text_embedding = self.CLIP_model.encode_text(Text_Encodings)
-        
+
+        # Batched separable 2D DCT over the grayscale images
+        DCT_features = torch.matmul(torch.matmul(self.DCT_basis, Gray_Images), self.DCT_basis.T)
         DCT_features_reshaped = DCT_features.view(DCT_features.size(0), -1)
         DCT_features_reshaped = torch.log(torch.abs(DCT_features_reshaped) + 1e-12)
         DCT_embedding = standard_scale(DCT_features_reshaped)
@@ -209,14 +219,14 @@ def train(CLIP_model, tokenizer, train_ds, val_ds, EPOCHS, BATCH_SIZE, LEARNING_
         total_samples = 0
         correct_train_preds = 0
         
-        for batch_idx, (image, DCT_features, labels, caption) in enumerate(tqdm(train_loader)):
+        for batch_idx, (image, grayscale, labels, caption) in enumerate(tqdm(train_loader)):
             image = image.to(device)
-            DCT_features = DCT_features.to(device)
+            grayscale = grayscale.to(device)
             labels = labels.long().to(device)
             Text_Emb = tokenizer(list(caption), context_length=77).to(device)
-            
+
             optimizer.zero_grad()
-            logits, _ = model(image, Text_Emb, DCT_features)
+            logits, _ = model(image, Text_Emb, grayscale)
             
             loss = loss_func(logits, labels)
             loss.backward()
@@ -237,13 +247,13 @@ def train(CLIP_model, tokenizer, train_ds, val_ds, EPOCHS, BATCH_SIZE, LEARNING_
         correct_val_preds = 0
         
         with torch.no_grad():
-            for batch_idx, (image, DCT_features, labels, caption) in enumerate(tqdm(val_loader)):
+            for batch_idx, (image, grayscale, labels, caption) in enumerate(tqdm(val_loader)):
                 image = image.to(device)
-                DCT_features = DCT_features.to(device)
+                grayscale = grayscale.to(device)
                 labels = labels.long().to(device)
                 Text_Emb = tokenizer(list(caption), context_length=77).to(device)
-                
-                logits, _ = model(image, Text_Emb, DCT_features)
+
+                logits, _ = model(image, Text_Emb, grayscale)
                 loss = loss_func(logits, labels)
                 
                 total_val_loss += loss.item()